@@ -1,16 +1,19 @@
 import argparse
 import html
 import json
-import math
 import os
 import random
 import re
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
 from glob import glob
 
 import cv2
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 from PIL import Image
 from tqdm import tqdm
 
@@ -26,14 +29,72 @@ try:
     PANDA_USE_PARALLEL = True
 except ImportError:
     PANDA_USE_PARALLEL = False
+PANDA_INITIALIZED = False
+PANDA_MIN_ROWS = 10000  # below this, starting the workers costs more than it saves
+USE_PARALLEL = True
+NUM_WORKERS = None
+ARROW_CSV = False
 
 
 def apply(df, func, **kwargs):
-    if PANDA_USE_PARALLEL:
+    global PANDA_INITIALIZED
+    if PANDA_USE_PARALLEL and len(df) >= PANDA_MIN_ROWS:
+        if not PANDA_INITIALIZED:
+            # initialized on first use only; the progress bar slows pandarallel down noticeably
+            nb_workers = NUM_WORKERS or min(os.cpu_count(), 16)
+            pandarallel.initialize(nb_workers=nb_workers, progress_bar=False)
+            PANDA_INITIALIZED = True
         return df.parallel_apply(func, **kwargs)
     return df.progress_apply(func, **kwargs)
 
 
+def cached_apply(series, func):
+    """
+    Apply func once per unique non-null value and map the results back, NaN is kept as is.
+    Captions are often heavily duplicated (e.g., templated LLaVA outputs), so expensive text processing is done only once.
+    """
+    uniques = pd.Series(series.dropna().unique())
+    mapping = dict(zip(uniques, apply(uniques, func)))
+    return series.map(mapping)
+
+
+def str_contains(series, pat):
+    """
+    Series.str.contains for user given patterns, missing values do not match.
+    Arrow strings are matched with RE2, which does not support e.g. lookarounds, the re module is used for those instead.
+    """
+    try:
+        return series.str.contains(pat, na=False)
+    except pa.ArrowInvalid:
+        return series.astype(object).str.contains(pat, na=False)
+
+
+def parallel_map(func, items, chunksize=None):
+    """
+    Lazily map func over items with a process pool, keeping the order of items.
+    Large chunks amortize the IPC cost for cheap per-item IO work.
+    """
+    if not USE_PARALLEL:
+        yield from tqdm(map(func, items), total=len(items))
+        return
+    num_workers = NUM_WORKERS or os.cpu_count()
+    if chunksize is None:
+        chunksize = max(32, len(items) // (num_workers * 8))
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        yield from tqdm(executor.map(func, items, chunksize=chunksize), total=len(items))
+
+
+IMG_EXTENSIONS_REGEX = r"(?:" + "|".join(re.escape(x) for x in IMG_EXTENSIONS) + r")$"
+INFO_DTYPE = np.dtype(
+    [
+        ("num_frames", "i8"),
+        ("height", "i8"),
+        ("width", "i8"),
+        ("aspect_ratio", "f8"),
+        ("fps", "f8"),
+        ("resolution", "f8"),
+    ]
+)
 TRAIN_COLUMNS = ["path", "text", "num_frames", "fps", "height", "width", "aspect_ratio", "resolution", "text_len"]
 PRE_TRAIN_COLUMNS = [
     "path",
@@ -65,6 +126,19 @@ def get_video_length(cap, method="header"):
     return length
 
 
+def gather_info(func, paths):
+    # results are written into a preallocated typed array instead of boxing them as tuples
+    info = np.empty(len(paths), dtype=INFO_DTYPE)
+    probed = info[["num_frames", "height", "width", "fps"]]  # view on the fields returned by func
+    for i, row in enumerate(parallel_map(func, paths)):
+        probed[i] = row
+    # derived columns are computed once over the whole arrays
+    height, width = info["height"], info["width"]
+    info["aspect_ratio"] = np.where(width > 0, height / np.maximum(width, 1), np.nan)
+    info["resolution"] = np.where(width > 0, height * width, np.nan)
+    return info
+
+
 def get_info(path):
     try:
         ext = os.path.splitext(path)[1].lower()
@@ -73,34 +147,31 @@ def get_info(path):
         else:
             return get_video_info(path)
     except:
-        return 0, 0, 0, np.nan, np.nan, np.nan
+        return 0, 0, 0, np.nan
 
 
 def get_image_info(path, backend="pillow"):
     if backend == "pillow":
         try:
-            with open(path, "rb") as f:
-                img = Image.open(f)
-                img = img.convert("RGB")
-            width, height = img.size
+            with Image.open(path) as img:
+                width, height = img.size
+                # still decode so that broken files are caught, JPEG only at 1/8 scale
+                img.draft("RGB", (max(width // 8, 1), max(height // 8, 1)))
+                img.load()
             num_frames, fps = 1, np.nan
-            hw = height * width
-            aspect_ratio = height / width if width > 0 else np.nan
-            return num_frames, height, width, aspect_ratio, fps, hw
+            return num_frames, height, width, fps
         except:
-            return 0, 0, 0, np.nan, np.nan, np.nan
+            return 0, 0, 0, np.nan
     elif backend == "cv2":
         try:
             im = cv2.imread(path)
             if im is None:
-                return 0, 0, 0, np.nan, np.nan, np.nan
+                return 0, 0, 0, np.nan
             height, width = im.shape[:2]
             num_frames, fps = 1, np.nan
-            hw = height * width
-            aspect_ratio = height / width if width > 0 else np.nan
-            return num_frames, height, width, aspect_ratio, fps, hw
+            return num_frames, height, width, fps
         except:
-            return 0, 0, 0, np.nan, np.nan, np.nan
+            return 0, 0, 0, np.nan
     else:
         raise ValueError
 
@@ -114,11 +185,9 @@ def get_video_info(path, backend="torchvision"):
                 fps = infos["video_fps"]
             else:
                 fps = np.nan
-            hw = height * width
-            aspect_ratio = height / width if width > 0 else np.nan
-            return num_frames, height, width, aspect_ratio, fps, hw
+            return num_frames, height, width, fps
         except:
-            return 0, 0, 0, np.nan, np.nan, np.nan
+            return 0, 0, 0, np.nan
     elif backend == "cv2":
         try:
             cap = cv2.VideoCapture(path)
@@ -128,15 +197,50 @@ def get_video_info(path, backend="torchvision"):
                 int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
                 float(cap.get(cv2.CAP_PROP_FPS)),
             )
-            hw = height * width
-            aspect_ratio = height / width if width > 0 else np.nan
-            return num_frames, height, width, aspect_ratio, fps, hw
+            return num_frames, height, width, fps
         except:
-            return 0, 0, 0, np.nan, np.nan, np.nan
+            return 0, 0, 0, np.nan
     else:
         raise ValueError
 
 
+# ======================================================
+# --ext
+# ======================================================
+
+
+def check_exists(paths):
+    """
+    Vectorized os.path.exists: list each parent directory once instead of calling stat per file.
+    Args:
+        paths (np.ndarray): file paths
+    Return:
+        np.ndarray: boolean mask of existing paths
+    """
+    # the original strings are kept per basename, as joining dirname and basename does not give back non-normalized paths
+    names_by_dir = {}
+    for path in paths:
+        names = names_by_dir.setdefault(os.path.dirname(path), {})
+        names.setdefault(os.path.basename(path), []).append(path)
+
+    existing = set()
+    for dir_path, names in names_by_dir.items():
+        try:
+            with os.scandir(dir_path or ".") as it:
+                # "." and ".." are not listed but exist with the directory, as does a trailing slash unless the path is ""
+                for name in ("", ".", "..") if dir_path else (".", ".."):
+                    existing.update(names.get(name, ()))
+                for entry in it:
+                    # broken symlinks are listed but do not exist
+                    if entry.name in names and (not entry.is_symlink() or os.path.exists(entry.path)):
+                        existing.update(names[entry.name])
+        except FileNotFoundError:
+            pass
+        except OSError:
+            existing.update(x for group in names.values() for x in group if os.path.exists(x))
+    return np.fromiter((path in existing for path in paths), dtype=bool, count=len(paths))
+
+
 # ======================================================
 # --refine-llm-caption
 # ======================================================
@@ -147,7 +251,6 @@ LLAVA_PREFIX = [
     "The video features ",
     "The video depicts ",
     "The video presents ",
-    "The video features ",
     "The video is ",
     "In the video, ",
     "The image shows ",
@@ -155,21 +258,31 @@ LLAVA_PREFIX = [
     "The image features ",
     "The image depicts ",
     "The image presents ",
-    "The image features ",
     "The image is ",
     "The image portrays ",
     "In the image, ",
 ]
-
-
-def remove_caption_prefix(caption):
-    for prefix in LLAVA_PREFIX:
-        if caption.startswith(prefix) or caption.startswith(prefix.lower()):
-            caption = caption[len(prefix) :].strip()
-            if caption[0].islower():
-                caption = caption[0].upper() + caption[1:]
-            return caption
-    return caption
+# kept as a pattern string so that .str methods on arrow-backed strings can run it as an arrow kernel
+# only the first letter of a prefix may be lower-cased, so it is matched by a character class, e.g. "[Tt]he video is "
+LLAVA_PREFIX_REGEX = (
+    r"^(?:"
+    + "|".join(f"[{p[0]}{p[0].lower()}]{re.escape(p[1:])}" for p in sorted(LLAVA_PREFIX, key=len, reverse=True))
+    + r")\s*"
+)
+
+
+def remove_caption_prefix(captions):
+    """
+    Args:
+        captions (pd.Series): captions to process, NaN is kept as is
+    Return:
+        pd.Series: captions with the LLaVA prefix removed and the first letter capitalized
+    """
+    captions = captions.copy()
+    mask = captions.notna() & captions.str.match(LLAVA_PREFIX_REGEX, na=False)
+    stripped = captions[mask].str.replace(LLAVA_PREFIX_REGEX, "", regex=True).str.strip()
+    captions[mask] = stripped.str[:1].str.upper() + stripped.str[1:]
+    return captions
 
 
 # ======================================================
@@ -224,12 +337,15 @@ def build_lang_detector(lang_to_detect):
     valid_lang = lang_dict[lang_to_detect]
     detector = LanguageDetectorBuilder.from_all_spoken_languages().with_low_accuracy_mode().build()
 
-    def detect_lang(caption):
-        confidence_values = detector.compute_language_confidence_values(caption)
-        confidence = [x.language for x in confidence_values[:5]]
-        if valid_lang not in confidence:
-            return False
-        return True
+    def detect_lang(captions, batch_size=10000):
+        # lingua releases the GIL and runs each batch on its own thread pool
+        # a caption is valid if the language is among the top-5 candidates
+        is_valid = []
+        for i in tqdm(range(0, len(captions), batch_size)):
+            batch = list(captions[i : i + batch_size])
+            for confidence_values in detector.compute_language_confidence_values_in_parallel(batch):
+                is_valid.append(any(x.language == valid_lang for x in confidence_values[:5]))
+        return is_valid
 
     return detect_lang
 
@@ -380,6 +496,9 @@ def text_preprocessing(text, use_text_preprocessing: bool = True):
         return text.lower().strip()
 
 
+URL_REGEX = r"https?://\S+"
+
+
 def has_human(text):
     first_sentence = text.split(".")[0]
     human_words = ["man", "woman", "child", "girl", "boy"]
@@ -493,27 +612,100 @@ def undo_score2text(data):
 # ======================================================
 
 
-def read_file(input_path):
+def read_csv_table(input_path, columns=None):
+    # multithreaded pyarrow reader; captions may contain newlines, which the default chunking would break on
+    parse_options = pa_csv.ParseOptions(newlines_in_values=True)
+    # empty fields and "NA"-like strings are missing values, as in pd.read_csv
+    convert_options = pa_csv.ConvertOptions(include_columns=columns, strings_can_be_null=True)
+    table = pa_csv.read_csv(input_path, parse_options=parse_options, convert_options=convert_options)
+    # pd.read_csv does not parse dates and times, re-read inferred temporal columns as strings
+    temporal_columns = [x.name for x in table.schema if pa.types.is_temporal(x.type)]
+    if len(temporal_columns) > 0:
+        convert_options.column_types = {x: pa.string() for x in temporal_columns}
+        table = pa_csv.read_csv(input_path, parse_options=parse_options, convert_options=convert_options)
+    # name columns with an empty header as pd.read_csv does, e.g., an unnamed index column
+    if "" in table.column_names:
+        table = table.rename_columns([x or f"Unnamed: {i}" for i, x in enumerate(table.column_names)])
+    return table
+
+
+def table_to_pandas(table):
+    # keep all-empty columns as float NaN like pd.read_csv instead of object None
+    for i, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.float64()))
+    return table.to_pandas()
+
+
+def read_csv(input_path, columns=None):
+    try:
+        return table_to_pandas(read_csv_table(input_path, columns=columns))
+    except pa.ArrowInvalid:
+        # malformed files, e.g., rows with missing fields, which pandas fills with NaN
+        return pd.read_csv(input_path, usecols=columns)
+
+
+def read_parquet_table(input_path):
+    table = pq.read_table(input_path)
+    # drop the index stored by DataFrame.to_parquet, the files are merged with a new index as pd.concat(ignore_index=True)
+    pandas_metadata = table.schema.pandas_metadata or {}
+    index_columns = [x for x in pandas_metadata.get("index_columns", []) if isinstance(x, str)]
+    return table.drop(index_columns).replace_schema_metadata(None)
+
+
+def read_table(input_path):
     if input_path.endswith(".csv"):
-        return pd.read_csv(input_path)
+        try:
+            return read_csv_table(input_path)
+        except pa.ArrowInvalid:
+            return pd.read_csv(input_path)
     elif input_path.endswith(".parquet"):
-        return pd.read_parquet(input_path)
+        return read_parquet_table(input_path)
     else:
         raise NotImplementedError(f"Unsupported file format: {input_path}")
 
 
+def write_csv(data, output_path):
+    if ARROW_CSV:
+        # pyarrow formats the cells in C with multiple threads, but the text differs from to_csv:
+        # all strings are quoted, booleans are written as true/false and whole floats without ".0"
+        try:
+            table = pa.Table.from_pandas(data, preserve_index=False)
+            return pa_csv.write_csv(table, output_path)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # object columns with mixed types cannot be converted, and list or struct columns cannot be written
+            pass
+    return data.to_csv(output_path, index=False)
+
+
 def save_file(data, output_path):
     output_dir = os.path.dirname(output_path)
     if not os.path.exists(output_dir) and output_dir != "":
         os.makedirs(output_dir)
     if output_path.endswith(".csv"):
-        return data.to_csv(output_path, index=False)
+        return write_csv(data, output_path)
     elif output_path.endswith(".parquet"):
         return data.to_parquet(output_path, index=False)
     else:
         raise NotImplementedError(f"Unsupported file format: {output_path}")
 
 
+def concat_tables(tables):
+    """
+    Merge the tables returned by read_table into one DataFrame, as pd.concat does.
+    """
+    if all(isinstance(x, pa.Table) for x in tables):
+        try:
+            # zero-copy concatenation of the arrow columns, int and float columns are unified as in pd.concat
+            return table_to_pandas(pa.concat_tables(tables, promote_options="permissive"))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+    # columns with incompatible types across files (e.g., int and string) become object columns,
+    # and files that only pandas could parse are already DataFrames
+    data = [x if isinstance(x, pd.DataFrame) else table_to_pandas(x) for x in tables]
+    return pd.concat(data, ignore_index=True, sort=False)
+
+
 def read_data(input_paths):
     if len(input_paths) == 0:
         print(f"No meta file to process. Exit.")
@@ -532,14 +724,14 @@ def read_data(input_paths):
     for i, input_path in enumerate(input_list):
         if not os.path.exists(input_path):
             raise FileNotFoundError
-        data.append(read_file(input_path))
+        data.append(read_table(input_path))
         basename = os.path.basename(input_path)
         input_name += os.path.splitext(basename)[0]
         if i != len(input_list) - 1:
             input_name += "+"
         print(f"==> Loaded meta (shape={data[-1].shape}) from '{input_path}'")
 
-    data = pd.concat(data, ignore_index=True, sort=False)
+    data = concat_tables(data)
     print(f"==> Merged {cnt} files. shape={data.shape}")
     return data, input_name
 
@@ -600,19 +792,26 @@ def refine_sentences(caption):
 def main(args):
     # reading data
     data, input_name = read_data(args.input)
+    # arrow-backed strings take less memory and run .str methods as arrow kernels
+    for col in ["path", "text"]:
+        if col in data.columns:
+            data[col] = data[col].astype("string[pyarrow]")
 
     # get output path
     output_path = get_output_path(args, input_name)
 
     # path subtract (difference set)
     if args.path_subtract is not None:
-        data_diff = pd.read_csv(args.path_subtract)
+        data_diff = read_csv(args.path_subtract, columns=["path"])
         print(f"Meta to subtract: shape={data_diff.shape}.")
-        data = data[~data["path"].isin(data_diff["path"])]
+        # a single hash probe per path, Series.isin is much slower on arrow-backed strings
+        paths_to_subtract = frozenset(data_diff["path"].tolist())
+        paths = data["path"].to_numpy()
+        data = data[np.fromiter((x not in paths_to_subtract for x in paths), dtype=bool, count=len(paths))]
 
     # path intersect
     if args.path_intersect is not None:
-        data_new = pd.read_csv(args.path_intersect)
+        data_new = read_csv(args.path_intersect)
         print(f"Meta to intersect: shape={data_new.shape}.")
 
         new_cols = data_new.columns.difference(data.columns)
@@ -633,35 +832,22 @@ def main(args):
         assert "path" in data.columns
         data["text"] = apply(data["path"], load_caption, ext=args.load_caption)
     if args.info:
-        info = apply(data["path"], get_info)
-        (
-            data["num_frames"],
-            data["height"],
-            data["width"],
-            data["aspect_ratio"],
-            data["fps"],
-            data["resolution"],
-        ) = zip(*info)
+        info = gather_info(get_info, data["path"].to_numpy())
+        for col in INFO_DTYPE.names:
+            data[col] = info[col]
     if args.video_info:
-        info = apply(data["path"], get_video_info)
-        (
-            data["num_frames"],
-            data["height"],
-            data["width"],
-            data["aspect_ratio"],
-            data["fps"],
-            data["resolution"],
-        ) = zip(*info)
+        info = gather_info(get_video_info, data["path"].to_numpy())
+        for col in INFO_DTYPE.names:
+            data[col] = info[col]
 
     # filtering path
     if args.path_filter_empty:
         assert "path" in data.columns
-        data = data[data["path"].str.len() > 0]
-        data = data[~data["path"].isna()]
+        data = data[data["path"].notna() & (data["path"].str.len() > 0)]
     if args.path_filter_substr:
-        data = data[~data["path"].str.contains(args.path_filter_substr)]
+        data = data[~str_contains(data["path"], args.path_filter_substr)]
     if args.path_keep_substr:
-        data = data[data["path"].str.contains(args.path_keep_substr)]
+        data = data[str_contains(data["path"], args.path_keep_substr)]
     if args.path_dedup:
         assert "path" in data.columns
         data = data.drop_duplicates(subset=["path"])
@@ -669,47 +855,65 @@ def main(args):
     # filtering text
     if args.text_filter_url:
         assert "text" in data.columns
-        data = data[~data["text"].str.contains(r"(?P<url>https?://[^\s]+)", regex=True)]
+        # only run the regex on captions containing the literal "http"
+        has_url = data["text"].str.contains("http", regex=False, na=False).to_numpy(dtype=bool, copy=True)
+        if has_url.any():
+            has_url[has_url] = data["text"][has_url].str.contains(URL_REGEX, na=False).to_numpy(dtype=bool)
+        data = data[~has_url]
     if args.lang is not None:
         assert "text" in data.columns
-        data = data[data["text"].progress_apply(detect_lang)]  # cannot parallelize
+        # detect each unique caption only once
+        captions = data["text"].dropna().unique()
+        valid_captions = frozenset(x for x, is_valid in zip(captions, detect_lang(captions)) if is_valid)
+        # a single hash probe per caption, Series.isin is much slower on arrow-backed strings
+        texts = data["text"].to_numpy(na_value=None)
+        data = data[np.fromiter((x in valid_captions for x in texts), dtype=bool, count=len(texts))]
     if args.text_filter_empty:
         assert "text" in data.columns
-        data = data[data["text"].str.len() > 0]
-        data = data[~data["text"].isna()]
+        data = data[data["text"].notna() & (data["text"].str.len() > 0)]
     if args.text_filter_substr:
         assert "text" in data.columns
-        data = data[~data["text"].str.contains(args.text_filter_substr)]
+        data = data[~str_contains(data["text"], args.text_filter_substr)]
 
     # processing
     if args.relpath is not None:
-        data["path"] = apply(data["path"], lambda x: os.path.relpath(x, args.relpath))
+        # strip the root directly for normalized paths under it, os.path.relpath is only called for the other paths
+        prefix = os.path.join(os.path.abspath(args.relpath), "")
+        data["path"] = [
+            x[len(prefix) :] if x.startswith(prefix) and os.path.normpath(x) == x else os.path.relpath(x, args.relpath)
+            for x in data["path"].to_numpy()
+        ]
     if args.abspath is not None:
-        data["path"] = apply(data["path"], lambda x: os.path.join(args.abspath, x))
+        # same as os.path.join(args.abspath, x)
+        prefix = os.path.join(args.abspath, "")
+        data["path"] = [x if x.startswith("/") else prefix + x for x in data["path"].to_numpy()]
     if args.path_to_id:
-        data["id"] = apply(data["path"], lambda x: os.path.splitext(os.path.basename(x))[0])
+        data["id"] = [os.path.splitext(os.path.basename(x))[0] for x in data["path"].to_numpy()]
     if args.merge_cmotion:
         data["text"] = apply(data, lambda x: merge_cmotion(x["text"], x["cmotion"]), axis=1)
     if args.text_remove_prefix:
         assert "text" in data.columns
-        data["text"] = apply(data["text"], remove_caption_prefix)
+        data["text"] = remove_caption_prefix(data["text"])
     if args.text_append is not None:
         assert "text" in data.columns
         data["text"] = data["text"] + args.text_append
     if args.text_refine_t5:
         assert "text" in data.columns
-        data["text"] = apply(
+        data["text"] = cached_apply(
             data["text"],
             partial(text_preprocessing, use_text_preprocessing=True),
         )
     if args.text_image2video:
         assert "text" in data.columns
-        data["text"] = apply(data["text"], lambda x: x.replace("still image", "video").replace("image", "video"))
+        data["text"] = [
+            x.replace("still image", "video").replace("image", "video") if "image" in x else x
+            for x in data["text"].to_numpy()
+        ]
     if args.count_num_token is not None:
         assert "text" in data.columns
-        data["text_len"] = apply(data["text"], lambda x: len(tokenizer(x)["input_ids"]))
+        data["text_len"] = cached_apply(data["text"], lambda x: len(tokenizer(x)["input_ids"]))
     if args.update_text is not None:
-        data_new = pd.read_csv(args.update_text)
+        data_new = read_csv(args.update_text, columns=["path", "text"])
         num_updated = data.path.isin(data_new.path).sum()
         print(f"Number of updated samples: {num_updated}.")
         data = data.set_index("path")
@@ -717,7 +921,7 @@ def main(args):
         data.update(data_new)
         data = data.reset_index()
     if args.text_refine_sentences:
-        data["text"] = apply(data["text"], refine_sentences)
+        data["text"] = cached_apply(data["text"], refine_sentences)
     if args.text_score2text:
         data["text"] = apply(data, score2text, axis=1)
     if args.text_undo_score2text:
@@ -733,65 +937,62 @@ def main(args):
     if args.filesize:
         assert "path" in data.columns
         data["filesize"] = apply(data["path"], lambda x: os.stat(x).st_size / 1024 / 1024)
+    # numeric filters are fused into a single mask so that data is only sliced once
+    mask = np.ones(len(data), dtype=bool)
     if args.fsmax is not None:
         assert "filesize" in data.columns
-        data = data[data["filesize"] <= args.fsmax]
+        mask &= data["filesize"].to_numpy() <= args.fsmax
     if args.fsmin is not None:
         assert "filesize" in data.columns
-        data = data[data["filesize"] >= args.fsmin]
+        mask &= data["filesize"].to_numpy() >= args.fsmin
     if args.text_filter_empty:
         assert "text" in data.columns
-        data = data[data["text"].str.len() > 0]
-        data = data[~data["text"].isna()]
+        mask &= data["text"].notna().to_numpy() & (data["text"].str.len() > 0).to_numpy(dtype=bool, na_value=False)
     if args.fmin is not None:
         assert "num_frames" in data.columns
-        data = data[data["num_frames"] >= args.fmin]
+        mask &= data["num_frames"].to_numpy() >= args.fmin
     if args.fmax is not None:
         assert "num_frames" in data.columns
-        data = data[data["num_frames"] <= args.fmax]
+        mask &= data["num_frames"].to_numpy() <= args.fmax
     if args.filter_dyn_fps is not False:
         assert "fps" in data.columns and "num_frames" in data.columns
-
-        def dyn_fps_filter(row, max_fps=args.dyn_fps_max_fps, keep_frames=args.dyn_fps_keep_frames):
-            # get scale factor
-            if math.isnan(row["fps"]):  # image
-                return True
-            scale_factor = math.ceil(row["fps"] / max_fps)
-            min_frames = keep_frames * scale_factor
-            return row["num_frames"] >= min_frames
-
-        dyn_fps_mask = data.apply(dyn_fps_filter, axis=1)
-        data = data[dyn_fps_mask]
+        # images (NaN fps) are kept; videos need keep_frames for each multiple of max_fps
+        fps = data["fps"].to_numpy(dtype=float)
+        min_frames = args.dyn_fps_keep_frames * np.ceil(fps / args.dyn_fps_max_fps)
+        mask &= np.isnan(fps) | (data["num_frames"].to_numpy() >= min_frames)
     if args.fpsmax is not None:
         assert "fps" in data.columns
-        data = data[(data["fps"] <= args.fpsmax) | np.isnan(data["fps"])]
+        fps = data["fps"].to_numpy(dtype=float)
+        mask &= (fps <= args.fpsmax) | np.isnan(fps)
     if args.hwmax is not None:
         if "resolution" not in data.columns:
             height = data["height"]
             width = data["width"]
             data["resolution"] = height * width
-        data = data[data["resolution"] <= args.hwmax]
+        mask &= data["resolution"].to_numpy() <= args.hwmax
     if args.aesmin is not None:
         assert "aes" in data.columns
-        data = data[data["aes"] >= args.aesmin]
+        mask &= data["aes"].to_numpy() >= args.aesmin
     if args.prefmin is not None:
         assert "pred_score" in data.columns
-        data = data[data["pred_score"] >= args.prefmin]
+        mask &= data["pred_score"].to_numpy() >= args.prefmin
     if args.matchmin is not None:
         assert "match" in data.columns
-        data = data[data["match"] >= args.matchmin]
+        mask &= data["match"].to_numpy() >= args.matchmin
     if args.flowmin is not None:
         assert "flow" in data.columns
-        data = data[data["flow"] >= args.flowmin]
+        mask &= data["flow"].to_numpy() >= args.flowmin
     if args.facemin is not None:
         assert "face_area_ratio" in data.columns
-        data = data[data["face_area_ratio"] >= args.facemin]
+        mask &= data["face_area_ratio"].to_numpy() >= args.facemin
+    if not mask.all():
+        data = data[mask]
     if args.text_dedup:
         data = data.drop_duplicates(subset=["text"], keep="first")
     if args.img_only:
-        data = data[data["path"].str.lower().str.endswith(IMG_EXTENSIONS)]
+        data = data[data["path"].str.lower().str.contains(IMG_EXTENSIONS_REGEX, na=False)]
     if args.vid_only:
-        data = data[~data["path"].str.lower().str.endswith(IMG_EXTENSIONS)]
+        data = data[~data["path"].str.lower().str.contains(IMG_EXTENSIONS_REGEX, na=False)]
     if args.filter_too_verbose:
         data = data[data["text"].apply(is_verbose_caption)]
     if args.h_le_w:
@@ -801,7 +1002,9 @@ def main(args):
 
     if args.ext:
         assert "path" in data.columns
-        data = data[apply(data["path"], os.path.exists)]
+        data = data[check_exists(data["path"].to_numpy())]
+    # contiguous index after all the filters, for the remaining slicing and the conversion at write time
+    data = data.reset_index(drop=True)
 
     # process data
     if args.shuffle:
@@ -826,15 +1029,19 @@ def main(args):
     if args.chunk is not None:
         assert len(args.input) == 1
         input_path = args.input[0]
-        res = np.array_split(data, args.chunk)
+        # same split as np.array_split, but each chunk is sliced only when it is written
+        chunk_size, remainder = divmod(len(data), args.chunk)
+        end = 0
         for idx in range(args.chunk):
+            start, end = end, end + chunk_size + (idx < remainder)
+            chunk = data.iloc[start:end]
             out_path = f"_chunk-{idx}-{args.chunk}".join(os.path.splitext(input_path))
-            shape = res[idx].shape
+            shape = chunk.shape
             print(f"==> Saving meta file (shape={shape}) to '{out_path}'")
             if args.format == "csv":
-                res[idx].to_csv(out_path, index=False)
+                write_csv(chunk, out_path)
             elif args.format == "parquet":
-                res[idx].to_parquet(out_path, index=False)
+                chunk.to_parquet(out_path, index=False)
             else:
                 raise NotImplementedError
             print(f"New meta (shape={shape}) saved to '{out_path}'")
@@ -850,6 +1057,9 @@ def parse_args():
     parser.add_argument("input", type=str, nargs="+", help="path to the input dataset")
     parser.add_argument("--output", type=str, default=None, help="output path")
     parser.add_argument("--format", type=str, default="csv", help="output format", choices=["csv", "parquet"])
+    parser.add_argument(
+        "--arrow-csv", action="store_true", help="write csv with the faster pyarrow writer, the formatting differs"
+    )
     parser.add_argument("--disable_parallel", action="store_true", help="disable parallel processing")
     parser.add_argument("--num-workers", type=int, default=None, help="number of workers")
     parser.add_argument("--seed", type=int, default=42, help="random seed")
@@ -1078,11 +1288,9 @@ if __name__ == "__main__":
     args = parse_args()
     if args.disable_parallel:
         PANDA_USE_PARALLEL = False
-    if PANDA_USE_PARALLEL:
-        if args.num_workers is not None:
-            pandarallel.initialize(nb_workers=args.num_workers, progress_bar=True)
-        else:
-            pandarallel.initialize(progress_bar=True)
+        USE_PARALLEL = False
+    NUM_WORKERS = args.num_workers
+    ARROW_CSV = args.arrow_csv
     if args.seed is not None:
         random.seed(args.seed)
         np.random.seed(args.seed)